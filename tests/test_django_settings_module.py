@@ -1,37 +1,64 @@
 """Tests which check the various ways you can set DJANGO_SETTINGS_MODULE
 
 If these tests fail you probably forgot to run "python setup.py develop".
+
+All inner test runs deliberately happen in a subprocess, either through
+_run() (testdir.runpytest()) or through testdir.runpython() with a script
+calling pytest.main(). Django settings can only be configured once per
+process and the outer test run has already configured them, so an
+in-process run (testdir.inline_run()) would neither import the settings
+module under test nor allow settings.configure() to be called. Running
+pytest-django's session fixtures a second time in the same process would
+also set up the Django test environment twice.
 """
 
 import django
 import pytest
 
 
-BARE_SETTINGS = '''
-# At least one database must be configured
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': ':memory:'
-    },
-}
+# django.setup() and app loading were added in Django 1.7.
+_HAS_DJANGO_SETUP = hasattr(django, 'setup')
+
+# None of the tests using these settings touch the database, leaving out
+# DATABASES keeps the database backend from being imported.
+MINIMAL_SETTINGS = '''
 SECRET_KEY = 'foobar'
 '''
 
 
+def _make_tpkg(testdir, name):
+    """Create the tpkg package with MINIMAL_SETTINGS as the module *name*"""
+    pkg = testdir.mkpydir('tpkg')
+    pkg.join(name + '.py').write(MINIMAL_SETTINGS)
+    return pkg
+
+
+def _run(testdir, *args):
+    """Run py.test quietly in a subprocess without rewriting asserts
+
+    The inner tests only contain trivial asserts, rewriting them is just
+    overhead in every run. Only the summary line and the failures of the
+    inner run are needed, so -q keeps the captured output small.
+    """
+    return testdir.runpytest('--assert=plain', '-q', *args)
+
+
+def _assert_passed(result, n=1):
+    """Assert that the inner test run reported *n* passed tests"""
+    assert '%d passed' % n in result.stdout.str()
+
+
 def test_ds_env(testdir, monkeypatch):
     monkeypatch.setenv('DJANGO_SETTINGS_MODULE', 'tpkg.settings_env')
-    pkg = testdir.mkpydir('tpkg')
-    settings = pkg.join('settings_env.py')
-    settings.write(BARE_SETTINGS)
+    _make_tpkg(testdir, 'settings_env')
     testdir.makepyfile("""
         import os
 
         def test_settings():
             assert os.environ['DJANGO_SETTINGS_MODULE'] == 'tpkg.settings_env'
     """)
-    result = testdir.runpytest()
-    result.stdout.fnmatch_lines(['*1 passed*'])
+    result = _run(testdir)
+    _assert_passed(result)
 
 
 def test_ds_ini(testdir, monkeypatch):
@@ -40,17 +67,15 @@ def test_ds_ini(testdir, monkeypatch):
        [pytest]
        DJANGO_SETTINGS_MODULE = tpkg.settings_ini
     """)
-    pkg = testdir.mkpydir('tpkg')
-    settings = pkg.join('settings_ini.py')
-    settings.write(BARE_SETTINGS)
+    _make_tpkg(testdir, 'settings_ini')
     testdir.makepyfile("""
         import os
 
         def test_ds():
             assert os.environ['DJANGO_SETTINGS_MODULE'] == 'tpkg.settings_ini'
     """)
-    result = testdir.runpytest()
-    result.stdout.fnmatch_lines(['*1 passed*'])
+    result = _run(testdir)
+    _assert_passed(result)
 
 
 def test_ds_option(testdir, monkeypatch):
@@ -59,17 +84,15 @@ def test_ds_option(testdir, monkeypatch):
        [pytest]
        DJANGO_SETTINGS_MODULE = DO_NOT_USE_ini
     """)
-    pkg = testdir.mkpydir('tpkg')
-    settings = pkg.join('settings_opt.py')
-    settings.write(BARE_SETTINGS)
+    _make_tpkg(testdir, 'settings_opt')
     testdir.makepyfile("""
         import os
 
         def test_ds():
             assert os.environ['DJANGO_SETTINGS_MODULE'] == 'tpkg.settings_opt'
     """)
-    result = testdir.runpytest('--ds=tpkg.settings_opt')
-    result.stdout.fnmatch_lines(['*1 passed*'])
+    result = _run(testdir, '--ds=tpkg.settings_opt')
+    _assert_passed(result)
 
 
 def test_ds_non_existent(testdir, monkeypatch):
@@ -79,7 +102,7 @@ def test_ds_non_existent(testdir, monkeypatch):
     """
     monkeypatch.setenv('DJANGO_SETTINGS_MODULE', 'DOES_NOT_EXIST')
     testdir.makepyfile('def test_ds(): pass')
-    result = testdir.runpytest()
+    result = _run(testdir)
     result.stderr.fnmatch_lines(
         ["*ImportError: Could not import settings 'DOES_NOT_EXIST'"
          " (Is it on sys.path?*): *"])
@@ -92,10 +115,10 @@ def test_ds_after_user_conftest(testdir, monkeypatch):
     """
     monkeypatch.setenv('DJANGO_SETTINGS_MODULE', 'settings_after_conftest')
     testdir.makepyfile('def test_ds(): pass')
-    testdir.makepyfile(settings_after_conftest="SECRET_KEY='secret'")
+    testdir.makepyfile(settings_after_conftest=MINIMAL_SETTINGS)
     # testdir.makeconftest("import sys; print(sys.path)")
-    result = testdir.runpytest('-v')
-    result.stdout.fnmatch_lines(['*1 passed*'])
+    result = _run(testdir, '-v')
+    _assert_passed(result)
 
 
 def test_django_settings_configure(testdir, monkeypatch):
@@ -118,7 +141,7 @@ def test_django_settings_configure(testdir, monkeypatch):
 
             import pytest
 
-            pytest.main()
+            pytest.main(['--assert=plain', '-q'])
     """)
 
     testdir.makepyfile("""
@@ -148,18 +171,21 @@ def test_django_settings_configure(testdir, monkeypatch):
 
     """)
     result = testdir.runpython(p)
-    result.stdout.fnmatch_lines([
-        "*4 passed*",
-    ])
+    _assert_passed(result, 4)
 
 
 def test_settings_in_hook(testdir, monkeypatch):
+    """
+    Make sure settings configured in a pytest_configure hook are used, and
+    that DEBUG is forced to False even when the settings enable it.
+    """
     monkeypatch.delenv('DJANGO_SETTINGS_MODULE')
     testdir.makeconftest("""
         from django.conf import settings
 
         def pytest_configure():
             settings.configure(SECRET_KEY='set from pytest_configure',
+                               DEBUG=True,
                                DATABASES={'default': {
                                    'ENGINE': 'django.db.backends.sqlite3',
                                    'NAME': ':memory:'}},
@@ -177,9 +203,13 @@ def test_settings_in_hook(testdir, monkeypatch):
         @pytest.mark.django_db
         def test_user_count():
             assert User.objects.count() == 0
+
+        def test_debug_is_false():
+            assert settings.DEBUG is False
     """)
-    r = testdir.runpytest()
+    r = _run(testdir)
     assert r.ret == 0
+    _assert_passed(r, 3)
 
 
 def test_django_not_loaded_without_settings(testdir, monkeypatch):
@@ -192,36 +222,11 @@ def test_django_not_loaded_without_settings(testdir, monkeypatch):
         def test_settings():
             assert 'django' not in sys.modules
     """)
-    result = testdir.runpytest()
-    result.stdout.fnmatch_lines(['*1 passed*'])
-
-
-def test_debug_false(testdir, monkeypatch):
-    monkeypatch.delenv('DJANGO_SETTINGS_MODULE')
-    testdir.makeconftest("""
-        from django.conf import settings
-
-        def pytest_configure():
-            settings.configure(SECRET_KEY='set from pytest_configure',
-                               DEBUG=True,
-                               DATABASES={'default': {
-                                   'ENGINE': 'django.db.backends.sqlite3',
-                                   'NAME': ':memory:'}},
-                               INSTALLED_APPS=['django.contrib.auth',
-                                               'django.contrib.contenttypes',])
-    """)
-
-    testdir.makepyfile("""
-        from django.conf import settings
-        def test_debug_is_false():
-            assert settings.DEBUG is False
-    """)
-
-    r = testdir.runpytest()
-    assert r.ret == 0
+    result = _run(testdir)
+    _assert_passed(result)
 
 
-@pytest.mark.skipif(not hasattr(django, 'setup'),
+@pytest.mark.skipif(not _HAS_DJANGO_SETUP,
                     reason="This Django version does not support app loading")
 @pytest.mark.django_project(extra_settings="""
     INSTALLED_APPS = [
@@ -261,7 +266,7 @@ def test_django_setup_sequence(django_testdir):
                 apps._lock.locked(), apps.ready))
         """)
 
-    result = django_testdir.runpytest('-s', '--tb=line')
+    result = _run(django_testdir, '-s', '--tb=line')
     result.stdout.fnmatch_lines(['*IMPORT: populating=True,ready=False*'])
     result.stdout.fnmatch_lines(['*READY(): populating=True*'])
     result.stdout.fnmatch_lines(['*TEST: populating=False,ready=True*'])